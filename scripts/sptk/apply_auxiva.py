@@ -14,13 +14,35 @@ from pathlib import Path
 
 import numpy as np
 
-from libs.data_handler import SpectrogramReader
+from libs.data_handler import SpectrogramReader, prefetch
 from libs.opts import StftParser
 from libs.utils import inverse_stft, get_logger, write_wav, EPSILON
 
 logger = get_logger(__name__)
 
 
+def solve_unit(A, n):
+    """
+    Solve A w = e_n in batch, i.e. the n-th column of A^{-1}
+    Arguments:
+        A: shape in F x N x N
+    Return
+        w: shape in F x N
+    """
+    F, N, _ = A.shape
+    if N == 2:
+        # closed form for 2x2 matrix: A^{-1} = adj(A) / det(A)
+        det = A[:, 0, 0] * A[:, 1, 1] - A[:, 0, 1] * A[:, 1, 0]
+        if n == 0:
+            w = np.stack([A[:, 1, 1], -A[:, 1, 0]], -1)
+        else:
+            w = np.stack([-A[:, 0, 1], A[:, 0, 0]], -1)
+        return w / det[:, None]
+    b = np.zeros([F, N, 1], dtype=A.dtype)
+    b[:, n] = 1
+    return np.linalg.solve(A, b)[..., 0]
+
+
 def auxiva(X, epochs=20):
     """
     Arguments:
@@ -29,29 +51,33 @@ def auxiva(X, epochs=20):
         Y: same shape as X
     """
     N, T, F = X.shape
-    # X: F x T x N
-    X = X.transpose([2, 1, 0])
+    # X: F x T x N, complex64 is precise enough for AuxIVA
+    X = X.transpose([2, 1, 0]).astype(np.complex64, copy=False)
     # F x N x N
-    W = np.array([np.eye(N, dtype=np.complex) for f in range(F)])
-    I = np.eye(N)
+    W = np.tile(np.eye(N, dtype=np.complex64)[None], (F, 1, 1))
     # Y: F x T x N
-    Y = np.einsum("...tn,...nx->...tx", X, np.conj(W))
+    Y = X @ np.conj(W)
 
+    # F x T x N
+    Xc = np.conj(X)
     for _ in range(epochs):
         # T x N
         R = np.sqrt(np.sum(np.abs(Y) ** 2, axis=0))
         # N x T
         Gr = 1 / (R.T + EPSILON)
-        for f in range(F):
-            for n in range(N):
-                # compute V
-                V = (np.dot(np.expand_dims(Gr[n], 0) * X[f].T, np.conj(
-                    X[f]))) / T
-                # update W
-                w = np.linalg.solve(np.conj(W[f].T) @ V, I[n])
-                W[f, :, n] = w / np.inner(np.conj(w), V @ w)
-
-        Y = np.einsum("...tn,...nx->...tx", X, np.conj(W))
+        # compute V for all sources at once (batched matmul, uses BLAS)
+        # (F x N x N x T) @ (F x 1 x T x N) => F x N x N x N
+        V = (Gr[None, :, None] * X.transpose(0, 2, 1)[:, None]) @ Xc[:, None]
+        V /= T
+        for n in range(N):
+            # F x N x N
+            Vn = V[:, n]
+            # update W: F x N, solved in batch along F
+            w = solve_unit(np.conj(W.transpose(0, 2, 1)) @ Vn, n)
+            W[:, :, n] = w / np.einsum("fi,fij,fj->f", np.conj(w), Vn,
+                                       w)[:, None]
+
+        Y = X @ np.conj(W)
     # F x T x N => N x T x F
     Y = np.transpose(Y, [2, 1, 0])
     return Y
@@ -70,7 +96,7 @@ def run(args):
         args.wav_scp,
         round_power_of_two=args.round_power_of_two,
         **stft_kwargs)
-    for key, spectrogram in spectrogram_reader:
+    for key, spectrogram in prefetch(spectrogram_reader):
         logger.info(f"Processing utterance {key}...")
         separated = auxiva(spectrogram, args.epochs)
         norm = spectrogram_reader.maxabs(key)
@@ -10,25 +10,34 @@ from distutils.util import strtobool
 
 import numpy as np
 
-from libs.data_handler import SpectrogramReader, ArchiveWriter
+from libs.data_handler import SpectrogramReader, ArchiveWriter, prefetch
 from libs.opts import StftParser, str2tuple
-from libs.spatial import srp_phat_linear, ipd, msc
+from libs.spatial import srp_phat_linear, linear_srp_transform, ipd, msc
 from libs.utils import get_logger, nextpow2
 
 logger = get_logger(__name__)
 
 
-def compute_spatial_feats(args, S):
+def srp_transform(args):
+    """
+    Steer vectors of SRP-PHAT, which are utterance-invariant
+    """
+    num_ffts = nextpow2(
+        args.frame_len) if args.round_power_of_two else args.frame_len
+    srp_kwargs = {
+        "sample_frequency": args.samp_frequency,
+        "num_doa": args.num_doa,
+        "num_bins": num_ffts // 2 + 1,
+        "samp_doa": not args.samp_tdoa
+    }
+    return linear_srp_transform(args.linear_topo, **srp_kwargs)
+
+
+def compute_spatial_feats(args, S, transform=None):
     if args.type == "srp":
-        num_ffts = nextpow2(
-            args.frame_len) if args.round_power_of_two else args.frame_len
-        srp_kwargs = {
-            "sample_frequency": args.samp_frequency,
-            "num_doa": args.num_doa,
-            "num_bins": num_ffts // 2 + 1,
-            "samp_doa": not args.samp_tdoa
-        }
-        return srp_phat_linear(S, args.linear_topo, **srp_kwargs)
+        if transform is None:
+            transform = srp_transform(args)
+        return srp_phat_linear(S, args.linear_topo, transform=transform)
     elif args.type == "ipd":
         if S.ndim < 3:
             raise ValueError("Only one-channel STFT available")
@@ -59,12 +68,14 @@ def run(args):
         "transpose": True  # T x F
     }
     spectrogram_reader = SpectrogramReader(args.wav_scp, **stft_kwargs)
+    # precompute once for all utterances
+    transform = srp_transform(args) if args.type == "srp" else None
 
     num_utts = 0
     with ArchiveWriter(args.dup_ark, args.scp) as writer:
-        for key, spectrogram in spectrogram_reader:
+        for key, spectrogram in prefetch(spectrogram_reader):
             # spectrogram: shape NxTxF
-            feats = compute_spatial_feats(args, spectrogram)
+            feats = compute_spatial_feats(args, spectrogram, transform)
             # feats: T x F
             writer.write(key, feats)
             num_utts += 1
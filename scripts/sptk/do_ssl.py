@@ -6,7 +6,7 @@ import argparse
 
 import numpy as np
 
-from libs.data_handler import SpectrogramReader, NumpyReader
+from libs.data_handler import SpectrogramReader, NumpyReader, prefetch
 from libs.opts import StftParser, str2tuple
 from libs.ssl import ml_ssl, srp_ssl, music_ssl
 from libs.utils import get_logger, EPSILON
@@ -53,7 +53,8 @@ def run(args):
         "center": args.center,
         "transpose": True
     }
-    steer_vector = np.load(args.steer_vector)
+    # complex64 is precise enough for SSL
+    steer_vector = np.load(args.steer_vector).astype(np.complex64)
     logger.info(f"Shape of the steer vector: {steer_vector.shape}")
     num_doa, _, _ = steer_vector.shape
     min_doa, max_doa = str2tuple(args.doa_range)
@@ -83,7 +84,7 @@ def run(args):
         srp_pair = None
 
     with open(args.doa_scp, "w") as doa_out:
-        for key, stft in spectrogram_reader:
+        for key, stft in prefetch(spectrogram_reader):
             # stft: M x T x F
             _, _, F = stft.shape
             if mask_reader:
@@ -91,7 +92,7 @@ def run(args):
                 mask = [r[key] for r in mask_reader] if mask_reader else None
                 if args.mask_eps >= 0 and len(mask_reader) > 1:
                     mask = add_wta(mask, eps=args.mask_eps)
-                mask = mask[0]
+                mask = mask[0].astype(np.float32, copy=False)
                 # F x T => T x F
                 if mask.shape[-1] != F:
                     mask = mask.transpose()
@@ -6,6 +6,7 @@ import codecs
 import glob
 import os
 import pickle
+import queue
 import random
 import subprocess
 import sys
@@ -23,7 +24,8 @@ from .utils import forward_stft, read_wav, write_wav, filekey
 __all__ = [
     "ArchiveReader", "ArchiveWriter", "WaveWriter", "NumpyWriter",
     "SpectrogramReader", "ScriptReader", "WaveReader", "NumpyReader",
-    "PickleReader", "MatReader", "BinaryReader", "ScpReader", "MatWriter", "DirReader"]
+    "PickleReader", "MatReader", "BinaryReader", "ScpReader", "MatWriter", "DirReader",
+    "prefetch"]
 
 
 def run_command(command, wait=True):
@@ -71,6 +73,53 @@ def pipe_fopen(command, mode, background=True):
     return p.stdout
 
 
+def prefetch(iterable, size=2):
+    """
+    Iterate over iterable (egs: readers) while loading the following
+    items in a background thread, to overlap I/O & STFT with computation
+    """
+    # (status, item) pairs, status in ["item", "done", "error"]
+    items = queue.Queue(maxsize=size)
+    # set when the consumer stops iterating
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def producer():
+        try:
+            for item in iterable:
+                if not put(("item", item)):
+                    return
+        except Exception as exc:
+            put(("error", exc))
+        else:
+            put(("done", None))
+
+    thread = threading.Thread(target=producer)
+    # exits abnormally if main thread is terminated .
+    thread.daemon = True
+    thread.start()
+    try:
+        while True:
+            status, item = items.get()
+            if status == "done":
+                break
+            if status == "error":
+                raise item
+            yield item
+    finally:
+        # exit producer if the generator is closed before exhausted
+        stop.set()
+        thread.join()
+
+
 def _fopen(fname, mode):
     """
     Extend file open function, to support 
@@ -484,10 +533,40 @@ class SpectrogramReader(WaveReader):
     def __init__(self, wav_scp, normalize=True, **kwargs):
         super(SpectrogramReader, self).__init__(wav_scp, normalize=normalize)
         self.stft_kwargs = kwargs
+        # scalar statistics of the loaded utterances, to avoid reading
+        # the wave again in maxabs/nsamps/... (samples are not kept)
+        self.stats = {}
+
+    def _stats(self, key):
+        stats = self.stats.get(key)
+        if stats is None:
+            stats = self._compute_stats(self.read(key))
+        return stats
+
+    def _compute_stats(self, samps):
+        s = samps if samps.ndim == 1 else samps[0]
+        return {
+            "nsamps": samps.shape[-1],
+            "maxabs": np.max(np.abs(samps)),
+            "power": np.linalg.norm(s, 2)**2 / s.size
+        }
+
+    def maxabs(self, key):
+        return self._stats(key)["maxabs"]
+
+    def duration(self, key):
+        return self._stats(key)["nsamps"] / self.sr
+
+    def nsamps(self, key):
+        return self._stats(key)["nsamps"]
+
+    def power(self, key):
+        return self._stats(key)["power"]
 
     def _load(self, key):
         # get wave samples
         samps = super().read(key)
+        self.stats[key] = self._compute_stats(samps)
         if samps.ndim == 1:
             return forward_stft(samps, **self.stft_kwargs)
         else:
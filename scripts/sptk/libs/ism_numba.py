@@ -0,0 +1,123 @@
+"""
+Image source method (ISM) for RIR simulation, ported from
+include/rir-generator.cc (omnidirectional microphones, maximum order),
+using numba to generate rirs of all the sources & receivers in parallel
+"""
+import math
+
+import numpy as np
+from numba import njit, prange
+
+
+def sabine_beta(size, rt60, v=340):
+    """
+    Compute reflection coefficients from RT60 (using Sabine formula)
+    """
+    if rt60 == 0:
+        return np.zeros(6)
+    l, w, h = size
+    V, S = l * w * h, (l * w + l * h + w * h) * 2
+    alpha = 24 * V * math.log(10) / (v * S * rt60)
+    if alpha > 1:
+        raise RuntimeError(f"{alpha:.2f} > 1: The reflection coefficients "
+                           "cannot be calculated using the current room "
+                           "parameters, i.e. room size and RT60")
+    return np.full(6, math.sqrt(1 - alpha))
+
+
+@njit(cache=True)
+def _ism(rir, size, beta, spos, rpos, sr, v, hp_filter):
+    """
+    Generate rir (in place) between one source and one receiver
+    """
+    nsamps = rir.shape[0]
+    cts = v / sr
+    # length of the low-pass interpolation window
+    Tw = 2 * int(0.004 * sr + 0.5)
+    # in samples
+    Lx, Ly, Lz = size[0] / cts, size[1] / cts, size[2] / cts
+    sx, sy, sz = spos[0] / cts, spos[1] / cts, spos[2] / cts
+    rx, ry, rz = rpos[0] / cts, rpos[1] / cts, rpos[2] / cts
+
+    nx = int(math.ceil(nsamps / (2 * Lx)))
+    ny = int(math.ceil(nsamps / (2 * Ly)))
+    nz = int(math.ceil(nsamps / (2 * Lz)))
+
+    for x in range(-nx, nx + 1):
+        for y in range(-ny, ny + 1):
+            for z in range(-nz, nz + 1):
+                for q in range(2):
+                    dx = (1 - 2 * q) * sx - rx + 2 * x * Lx
+                    gx = beta[0]**abs(x - q) * beta[1]**abs(x)
+                    for j in range(2):
+                        dy = (1 - 2 * j) * sy - ry + 2 * y * Ly
+                        gy = beta[2]**abs(y - j) * beta[3]**abs(y)
+                        for k in range(2):
+                            dz = (1 - 2 * k) * sz - rz + 2 * z * Lz
+                            gz = beta[4]**abs(z - k) * beta[5]**abs(z)
+                            dist = math.sqrt(dx * dx + dy * dy + dz * dz)
+                            fdist = math.floor(dist)
+                            if fdist >= nsamps:
+                                continue
+                            pos = int(fdist) - Tw // 2 + 1
+                            gain = gx * gy * gz / (4 * math.pi * dist * cts)
+                            frac = dist - fdist
+                            for n in range(Tw):
+                                t = pos + n
+                                if t < 0 or t >= nsamps:
+                                    continue
+                                # windowed sinc interpolation
+                                a = n + 1 - frac
+                                win = 1 - math.cos(2 * math.pi * a / Tw)
+                                b = math.pi * (a - Tw // 2)
+                                sinc = 1.0 if b == 0 else math.sin(b) / b
+                                rir[t] += 0.5 * gain * win * sinc
+    if hp_filter:
+        # high-pass filter (cut-off: 100Hz) proposed by Allen and Berkley
+        W = 2 * math.pi * 100 / sr
+        R1 = math.exp(-W)
+        B1, B2, A1 = 2 * R1 * math.cos(W), -R1 * R1, -1 - R1
+        y0, y1, y2 = 0.0, 0.0, 0.0
+        for t in range(nsamps):
+            y2, y1 = y1, y0
+            y0 = B1 * y1 + B2 * y2 + rir[t]
+            rir[t] = y0 + A1 * y1 + R1 * y2
+
+
+@njit(parallel=True, cache=True)
+def _ism_batch(size, beta, spos, rpos, sr, nsamps, v, hp_filter):
+    S, R = spos.shape[0], rpos.shape[0]
+    rirs = np.zeros((S, R, nsamps))
+    # each thread fills one rir
+    for i in prange(S * R):
+        s, r = i // R, i % R
+        _ism(rirs[s, r], size, beta, spos[s], rpos[r], sr, v, hp_filter)
+    return rirs
+
+
+def ism_batch(size,
+              beta,
+              spos,
+              rpos,
+              sr=16000,
+              nsamps=4096,
+              v=340,
+              hp_filter=True):
+    """
+    Generate rirs for all the sources & receivers in a room
+    Arguments:
+        size: (l, w, h) of the room
+        beta: RT60 (scalar) or 6 reflection coefficients
+        spos: S x 3, locations of the sources
+        rpos: R x 3, locations of the receivers
+    Return:
+        rirs: S x R x T
+    """
+    if np.isscalar(beta):
+        beta = sabine_beta(size, beta, v=v)
+    rirs = _ism_batch(np.asarray(size, dtype=np.float64),
+                      np.asarray(beta, dtype=np.float64),
+                      np.array(spos, dtype=np.float64, ndmin=2),
+                      np.array(rpos, dtype=np.float64, ndmin=2), sr, nsamps,
+                      float(v), hp_filter)
+    return rirs.astype(np.float32)
@@ -34,12 +34,35 @@ def linear_tdoa_grid(dist,
     return np.exp(-1j * np.outer(omega, tau))
 
 
-def gcc_phat_linear(si, sj, dij, normalize=True, apply_floor=True, **kwargs):
+def linear_srp_transform(d, **kwargs):
+    """
+    Precompute transform matrix of each microphone pair for linear array
+    Arguments:
+        d: topology for linear microphone arrays
+        kwargs: kwargs for linear_tdoa_grid
+    Return:
+        list of F x D matrix, in order of pairs (i, j), i < j
+    """
+    N = len(d)
+    return [
+        linear_tdoa_grid(d[j] - d[i], **kwargs) for i in range(N)
+        for j in range(i + 1, N)
+    ]
+
+
+def gcc_phat_linear(si,
+                    sj,
+                    dij,
+                    normalize=True,
+                    apply_floor=True,
+                    transform=None,
+                    **kwargs):
     """
     GCC-PHAT algorithm for linear array
     Arguments:
         si, sj: shape as T x F
         dij: distance between microphone i and j
+        transform: precomputed output of linear_tdoa_grid (F x D) or None
         kwargs: kwargs for linear_tdoa_grid
     Return:
         shape as T x D
@@ -48,7 +71,8 @@ def gcc_phat_linear(si, sj, dij, normalize=True, apply_floor=True, **kwargs):
     # coherence = si * sj.conj() / (np.maximum(np.abs(si) * np.abs(sj), EPSILON))
     coherence = np.exp(1j * (np.angle(si) - np.angle(sj)))
     # transform: F x D
-    transform = linear_tdoa_grid(dij, **kwargs)
+    if transform is None:
+        transform = linear_tdoa_grid(dij, **kwargs)
     spectrum = np.real(coherence @ transform)
     if normalize:
         spectrum = spectrum / np.max(np.maximum(np.abs(spectrum), EPSILON))
@@ -92,12 +116,18 @@ def gcc_phat_diag(si,
     return spectrum
 
 
-def srp_phat_linear(S, d, normalize=True, apply_floor=True, **kwargs):
+def srp_phat_linear(S,
+                    d,
+                    normalize=True,
+                    apply_floor=True,
+                    transform=None,
+                    **kwargs):
     """
     SRP-PHAT algorithm for linear array
     Arguments:
         S: multi-channel STFT, shape as N x T x F
         d: topology for linear microphone arrays
+        transform: precomputed output of linear_srp_transform or None
         kwargs: kwargs for linear_tdoa_grid
     Return:
         shape as T x D
@@ -111,13 +141,23 @@ def srp_phat_linear(S, d, normalize=True, apply_floor=True, **kwargs):
                 len(d), N))
     if S.ndim == 2:
         raise ValueError("Only one-channel STFT available")
-    gcc = gcc_phat_linear(S[0], S[1], d[1] - d[0], **kwargs)
+    if transform is None:
+        transform = linear_srp_transform(d, **kwargs)
     if N == 2:
-        return gcc
-    srp = np.zeros_like(gcc)
+        return gcc_phat_linear(S[0],
+                               S[1],
+                               d[1] - d[0],
+                               transform=transform[0],
+                               **kwargs)
+    srp = 0
     pair = [(i, j) for i in range(N) for j in range(i + 1, N)]
-    for i, j in pair:
-        srp += gcc_phat_linear(S[i], S[j], d[j] - d[i], normalize, apply_floor,
+    for (i, j), trans in zip(pair, transform):
+        srp += gcc_phat_linear(S[i],
+                               S[j],
+                               d[j] - d[i],
+                               normalize,
+                               apply_floor,
+                               transform=trans,
                                **kwargs)
     return srp * 2 / (N * (N - 1))
 
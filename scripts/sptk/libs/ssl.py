@@ -6,7 +6,7 @@ Sound Source Localization (SSL) Module
 """
 import numpy as np
 
-from .utils import cmat_abs
+from .utils import cmat_abs, EPSILON
 
 
 def ml_ssl(stft, sv, compression=0, eps=1e-8, norm=False, mask=None):
@@ -22,19 +22,26 @@ def ml_ssl(stft, sv, compression=0, eps=1e-8, norm=False, mask=None):
     """
     _, T, F = stft.shape
     if mask is None:
-        mask = np.ones([T, F])
+        mask = np.ones([T, F], dtype=np.float32)
     # make sure sv is normalized
     sv = sv / np.linalg.norm(sv, axis=1, keepdims=True)
     if norm:
         stft = stft / np.maximum(cmat_abs(stft), eps)
-    ssh_cor = np.abs(np.einsum("mtf,mtf->tf", stft, stft.conj()))
-    ssv_cor = np.abs(np.einsum("amf,mtf->atf", sv, stft.conj())) ** 2
+    # T x F
+    ssh_cor = np.sum(stft.real * stft.real + stft.imag * stft.imag, 0)
+    # F x A x M @ F x M x T => F x A x T
+    ssv_cor = np.conj(sv.transpose(2, 0, 1)) @ stft.transpose(2, 0, 1)
     # A x T x F
-    delta = ssh_cor[None, ...] - ssv_cor / (1 + eps)
+    ssv_cor = (ssv_cor.real ** 2 + ssv_cor.imag ** 2).transpose(1, 2, 0)
+    # reuse the buffer of ssv_cor to avoid temporaries
+    delta = ssv_cor
+    delta /= -(1 + eps)
+    delta += ssh_cor[None, ...]
     if compression <= 0:
-        tf_loglike = -np.log(np.maximum(delta, eps))
+        tf_loglike = np.log(np.maximum(delta, eps, out=delta), out=delta)
     else:
-        tf_loglike = -np.power(delta, compression)
+        tf_loglike = np.power(delta, compression, out=delta)
+    np.negative(tf_loglike, out=tf_loglike)
     # masking
     if mask.ndim == 2:
         loglike = np.sum(mask[None, ...] * tf_loglike, (1, 2))
@@ -58,22 +65,20 @@ def srp_ssl(stft, sv, srp_pair=None, mask=None):
         raise ValueError("srp_pair cannot be None, (list, list)")
     _, T, F = stft.shape
     if mask is None:
-        mask = np.ones([T, F])
+        mask = np.ones([T, F], dtype=np.float32)
     index_l, index_r = srp_pair
-    # M x T x F
-    obs_pha = np.angle(stft)
-    # A x M x F
-    ora_pha = np.angle(sv)
-    # observed ipd: P x T x F
-    obs_ipd = obs_pha[index_l] - obs_pha[index_r]
-    # oracle ipd: A x P x F
-    ora_ipd = ora_pha[:, index_l] - ora_pha[:, index_r]
-    # directional feature: A x P x T x F
-    af = np.cos(obs_ipd[None, ...] - ora_ipd[..., None, :])
-    # mean: A x T x F
-    af = np.mean(af, 1)
-    # mask and sum: A
-    srp = np.sum(af * mask[None, ...], (1, 2))
+    # observed ipd (unit cross spectrum): P x T x F
+    obs_ipd = stft[index_l] * stft[index_r].conj()
+    obs_ipd /= np.maximum(cmat_abs(obs_ipd), EPSILON)
+    # oracle ipd (unit cross spectrum): A x P x F
+    ora_ipd = sv[:, index_l] * sv[:, index_r].conj()
+    ora_ipd /= np.maximum(cmat_abs(ora_ipd), EPSILON)
+    # cos(o - a) = Re(e^{jo} * e^{-ja}), so apply mask and sum along
+    # time axis first, avoid the A x P x T x F directional feature
+    # P x F
+    obs_ipd = np.einsum("ptf,tf->pf", obs_ipd, mask)
+    # mean along P and sum along F: A
+    srp = np.sum(np.real(ora_ipd.conj() * obs_ipd), (1, 2)) / ora_ipd.shape[1]
     return np.argmax(srp)
 
 
@@ -89,22 +94,25 @@ def music_ssl(stft, sv, mask=None):
     """
     _, T, F = stft.shape
     if mask is None:
-        mask = np.ones([T, F])
+        mask = np.ones([T, F], dtype=np.float32)
     # F x M x T
     obs = np.transpose(stft * mask, (2, 0, 1))
     # F x M x M
     obs_covar = np.einsum("...at,...bt->...ab", obs, obs.conj()) / T
     # w: ascending order
     _, v = np.linalg.eigh(obs_covar)
-    # F x M x M - 1
-    noise_sub = v[..., :-1]
-    # F x M x M
-    noise_covar = np.einsum("...at,...bt->...ab", noise_sub, noise_sub.conj())
+    # F x M x 1, principal eigenvector (signal subspace)
+    signal_sub = v[..., -1:]
+    # F x M x M, v is unitary, so projection on noise subspace
+    # equals to I - signal_sub @ signal_sub^H
+    noise_covar = np.eye(v.shape[-1], dtype=v.dtype) - signal_sub @ np.conj(
+        signal_sub.swapaxes(-1, -2))
     # F x A x M
     sv = np.transpose(sv, (2, 0, 1))
+    # F x A x M @ F x M x M => F x A x M
+    denorm = np.conj(sv) @ noise_covar
     # F x A
-    denorm = np.einsum("...a,...ab,...b->...", sv.conj(), noise_covar[:, None],
-                       sv)
+    denorm = np.sum(denorm * sv, -1)
     # A
     score = np.sum(np.abs(denorm), axis=0)
     return np.argmin(score)
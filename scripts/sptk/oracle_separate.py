@@ -4,12 +4,13 @@
 
 import argparse
 import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from distutils.util import strtobool
 
 import numpy as np
 from tqdm import tqdm
 
-from libs.data_handler import SpectrogramReader
+from libs.data_handler import SpectrogramReader, prefetch
 from libs.opts import StftParser
 from libs.utils import inverse_stft, get_logger, cmat_abs, write_wav, EPSILON
 
@@ -23,66 +24,151 @@ def compute_mask(mixture, targets_list, mask_type):
         targets_list: python list of target signal's STFT results(complex result)
         mask_type: ["irm", "ibm", "iam", "psm"]
     Return:
-        masks_list
+        masks_list (bool for IBM, float32 for others)
     """
     if mask_type == "ibm":
-        max_index = np.argmax(
-            np.stack([cmat_abs(mat) for mat in targets_list]), 0)
-        return [max_index == s for s in range(len(targets_list))]
+        num_spks = len(targets_list)
+        # K x T x F
+        mags = np.empty((num_spks,) + targets_list[0].shape, dtype=np.float32)
+        for k, mat in enumerate(targets_list):
+            np.abs(mat, out=mags[k])
+        max_index = np.argmax(mags, 0)
+        return list(max_index == np.arange(num_spks)[:, None, None])
 
-    if mask_type == "irm":
-        denominator = sum([cmat_abs(mat) for mat in targets_list]) + EPSILON
-    else:
-        denominator = cmat_abs(mixture) + EPSILON
     if mask_type != "psm":
-        masks = [cmat_abs(mat) / denominator for mat in targets_list]
+        # compute magnitude of each target only once
+        masks = [cmat_abs(mat) for mat in targets_list]
+        if mask_type == "irm":
+            denominator = np.full_like(masks[0], EPSILON)
+            for mag in masks:
+                denominator += mag
+        else:
+            denominator = cmat_abs(mixture) + EPSILON
+        for mask in masks:
+            mask /= denominator
     else:
+        denominator = cmat_abs(mixture) + EPSILON
         mixture_phase = np.angle(mixture)
-        masks = [
-            cmat_abs(mat) * np.cos(mixture_phase - np.angle(mat)) / denominator
-            for mat in targets_list
-        ]
+        masks = []
+        for mat in targets_list:
+            # compute cos(mixture_phase - target_phase) in place
+            mask = np.angle(mat)
+            np.subtract(mixture_phase, mask, out=mask)
+            np.cos(mask, out=mask)
+            mask *= cmat_abs(mat)
+            mask /= denominator
+            masks.append(mask)
     return masks
 
 
-def run(args):
-    # return complex result
-    stft_kwargs = {
-        "frame_len": args.frame_len,
-        "frame_hop": args.frame_hop,
-        "window": args.window,
-        "center": args.center
-    }
-    logger.info(f"Using mask: {args.mask.upper()}")
-    mixture_reader = SpectrogramReader(
-        args.mix_scp,
-        round_power_of_two=args.round_power_of_two,
-        **stft_kwargs)
-    ref_scp_list = args.ref_scp.split(",")
-    logger.info(f"Number of speakers: {len(ref_scp_list)}")
-    targets_reader = [
-        SpectrogramReader(scp, **stft_kwargs) for scp in ref_scp_list
-    ]
-    num_utts = 0
-    for key, mixture in tqdm(mixture_reader):
-        nsamps = mixture_reader.nsamps(key) if args.keep_length else None
-        skip = False
-        for reader in targets_reader:
+class Separator(object):
+    """
+    Oracle separator for one utterance
+    """
+
+    def __init__(self, args):
+        # return complex result
+        self.stft_kwargs = {
+            "frame_len": args.frame_len,
+            "frame_hop": args.frame_hop,
+            "window": args.window,
+            "center": args.center
+        }
+        self.mixture_reader = SpectrogramReader(
+            args.mix_scp,
+            round_power_of_two=args.round_power_of_two,
+            **self.stft_kwargs)
+        self.targets_reader = [
+            SpectrogramReader(scp, **self.stft_kwargs)
+            for scp in args.ref_scp.split(",")
+        ]
+        self.args = args
+
+    def load(self, key):
+        """
+        Load STFT of mixture and targets, return None if missing targets
+        """
+        for reader in self.targets_reader:
             if key not in reader:
                 logger.info(f"Skip utterance {key}, missing targets")
-                skip = True
-                break
-        if skip:
-            continue
-        num_utts += 1
-        targets_list = [reader[key] for reader in targets_reader]
-        spk_masks = compute_mask(mixture, targets_list, args.mask)
-        for index, mask in enumerate(spk_masks):
-            samps = inverse_stft(mixture * mask, **stft_kwargs, nsamps=nsamps)
-            write_wav(os.path.join(args.dump_dir, f"spk{index + 1}/{key}.wav"),
+                return None
+        mixture = self.mixture_reader[key]
+        nsamps = self.mixture_reader.nsamps(
+            key) if self.args.keep_length else None
+        targets_list = [reader[key] for reader in self.targets_reader]
+        return key, mixture, targets_list, nsamps
+
+    def __call__(self, key):
+        """
+        Separate utterance "key", return false if skipped
+        """
+        egs = self.load(key)
+        if egs is None:
+            return False
+        self.separate(*egs)
+        return True
+
+    def separate(self, key, mixture, targets_list, nsamps):
+        """
+        Compute oracle masks and dump separated speakers
+        """
+        spk_masks = compute_mask(mixture, targets_list, self.args.mask)
+
+        def dump(index, mask):
+            samps = inverse_stft(mixture * mask,
+                                 **self.stft_kwargs,
+                                 nsamps=nsamps)
+            write_wav(os.path.join(self.args.dump_dir,
+                                   f"spk{index + 1}/{key}.wav"),
                       samps,
-                      sr=args.sr)
-    logger.info(f"Processed {num_utts} utterance")
+                      sr=self.args.sr)
+
+        # iSTFT & writing of each speaker are independent
+        with ThreadPoolExecutor(max_workers=len(spk_masks)) as executor:
+            # list(): raise exceptions in the worker threads
+            list(executor.map(dump, range(len(spk_masks)), spk_masks))
+
+
+# separator instance in each worker process
+worker_separator = None
+
+
+def init_worker(args):
+    global worker_separator
+    worker_separator = Separator(args)
+
+
+def run_worker(key):
+    return worker_separator(key)
+
+
+def run(args):
+    logger.info(f"Using mask: {args.mask.upper()}")
+    num_spks = len(args.ref_scp.split(","))
+    logger.info(f"Number of speakers: {num_spks}")
+    # create output directories up front, shared by the workers (--nj > 1)
+    for index in range(num_spks):
+        os.makedirs(os.path.join(args.dump_dir, f"spk{index + 1}"),
+                    exist_ok=True)
+    separator = Separator(args)
+    utt_keys = separator.mixture_reader.index_keys
+    if args.nj <= 1:
+        done = []
+        # load next utterances while separating current one
+        for egs in tqdm(prefetch(map(separator.load, utt_keys)),
+                        total=len(utt_keys)):
+            if egs is not None:
+                separator.separate(*egs)
+            done.append(egs is not None)
+    else:
+        # utterances are independent, process them in parallel
+        with ProcessPoolExecutor(max_workers=args.nj,
+                                 initializer=init_worker,
+                                 initargs=(args,)) as executor:
+            done = list(
+                tqdm(executor.map(run_worker, utt_keys, chunksize=8),
+                     total=len(utt_keys)))
+    logger.info(f"Processed {sum(done)} utterance")
 
 
 if __name__ == "__main__":
@@ -117,5 +203,10 @@ if __name__ == "__main__":
                         type=strtobool,
                         default=False,
                         help="If ture, keep result the same length as orginal")
+    parser.add_argument("--nj",
+                        type=int,
+                        default=1,
+                        help="Number of processes to separate "
+                             "utterances in parallel")
     args = parser.parse_args()
     run(args)
@@ -9,6 +9,7 @@ Generate scripts for RIR simulation which use
 """
 import argparse
 import json
+import math
 import random
 import shutil
 from distutils.util import strtobool
@@ -220,7 +221,7 @@ class RoomGenerator(object):
                 # check rt60 here
                 S, V = l * w * h, (l * w + l * h + w * h) * 2
                 # sabine formula
-                rt60_min = 24 * V * np.log(10) / (v * S)
+                rt60_min = 24 * V * math.log(10) / (v * S)
                 if rt60_min >= self.rt60.max:
                     return None
                 else:
@@ -228,7 +229,7 @@ class RoomGenerator(object):
                     return Room(l, w, h, rt60=rt60)
         else:
             absc = self.absc.sample()
-            return Room(l, w, h, refl=np.sqrt(1 - absc))
+            return Room(l, w, h, refl=math.sqrt(1 - absc))
 
 
 class RirSimulator(object):
@@ -290,20 +291,20 @@ class RirSimulator(object):
             # speaker distance
             dst = random.uniform(min_src_dist, max_src_dist)
             # sample from 0-180
-            doa = random.uniform(0, np.pi)
+            doa = random.uniform(0, math.pi)
             if not self.vertical:
-                sx = mx + np.cos(doa) * dst
-                sy = my + np.sin(doa) * dst
+                sx = mx + math.cos(doa) * dst
+                sy = my + math.sin(doa) * dst
             else:
-                sx = my - np.cos(doa) * dst
-                sy = mx + np.sin(doa) * dst
+                sx = my - math.cos(doa) * dst
+                sy = mx + math.sin(doa) * dst
             # check speaker location
             if 0 >= sx or sx >= rx or 0 >= sy or sy >= ry:
                 continue
             done += 1
             stat = {
                 "pos": (Rf(sx), Rf(sy), Rf(sz)),
-                "doa": Rf(doa * 180 / np.pi),
+                "doa": Rf(math.degrees(doa)),
                 "dst": Rf(dst)
             }
             stats.append(stat)
@@ -6,21 +6,28 @@ Generate scripts for RIR simulation which use
     1) rir-simulate (see src/rir-simulate.cc)
     2) pyrirgen (see https://github.com/Marvin182/rir-generator)
     3) gpurir (see https://github.com/DavidDiazGuerra/gpuRIR)
+    4) numba version of the image source method (see libs/ism_numba.py)
 """
 import argparse
 import json
-import random
+import math
 import shutil
+import subprocess
+import textwrap
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+from contextlib import closing, ExitStack
 from distutils.util import strtobool
+from multiprocessing import Pool
 from pathlib import Path
 
 import matplotlib.pyplot as plt
 import numpy as np
 
-from libs.data_handler import run_command
+from libs.data_handler import prefetch
 from libs.opts import str2tuple
 from libs.sampler import UniformSampler
-from libs.utils import get_logger, write_wav
+from libs.utils import get_logger, write_wav, EPSILON, MAX_INT16
 
 try:
     import pyrirgen
@@ -29,15 +36,27 @@ try:
 except ImportError:
     pyrirgen_available = False
 
+try:
+    from PIL import Image, ImageDraw
+
+    pil_available = True
+except ImportError:
+    pil_available = False
+
 try:
     import gpuRIR as pygpurir
 
     gpu_rir_available = True
-    pygpurir.activateMixedPrecision(False)
-    pygpurir.activateLUT(True)
 except ImportError:
     gpu_rir_available = False
 
+try:
+    from libs.ism_numba import ism_batch
+
+    numba_available = True
+except ImportError:
+    numba_available = False
+
 if shutil.which("rir-simulate"):
     cpp_rir_available = True
 else:
@@ -50,6 +69,35 @@ default_fmt = "jpg"
 
 logger = get_logger(__name__)
 
+# (figure, axes) reused by all rooms
+room_canvas = None
+
+
+def get_canvas():
+    """
+    Return the figure & axes to plot rooms on (created at the first call)
+    """
+    global room_canvas
+    if room_canvas is None:
+        room_canvas = plt.subplots()
+    return room_canvas
+
+
+def close_canvas():
+    global room_canvas
+    if room_canvas is not None:
+        plt.close(room_canvas[0])
+        room_canvas = None
+
+
+def quantize_rir(rir, axis=None):
+    """
+    Normalize rirs by the peak value (along axis) and quantize to int16
+    """
+    peak = np.max(np.abs(rir), axis=axis, keepdims=True)
+    rir = rir * (MAX_INT16 / np.maximum(peak, EPSILON))
+    return np.clip(rir, -MAX_INT16 - 1, MAX_INT16).astype(np.int16)
+
 
 class Room(object):
     """
@@ -61,6 +109,10 @@ class Room(object):
         self.beta = rt60 if rt60 is not None else [refl] * 6
         self.memo = "{}={:.2f}".format("RT60" if rt60 is not None else "Refl",
                                        rt60 if rt60 is not None else refl)
+        # arguments of rir-simulate, formatted once
+        self._beta_str = ",".join(f"{b:.3f}" for b in self.beta) if isinstance(
+            self.beta, list) else str(round(self.beta, 3))
+        self._size_str = ",".join(f"{s:.3f}" for s in self.size)
 
     def set_mic(self, topo, center):
         """
@@ -69,9 +121,16 @@ class Room(object):
         center: center 3D postion for microphone array
         """
         Mx, My, Mz = center
-        self.rpos = [(Mx + x, My + y, Mz) for (x, y) in topo]
+        pos = [(Mx + x, My + y, Mz) for (x, y) in topo]
+        # N x 3
+        self.rpos = np.array(pos, dtype=np.float32)
         self.topo = topo
         self.rcen = (Mx, My)
+        # location for each microphone (for rir-simulate), formatted from
+        # the float64 positions as float32 may round differently
+        self._rpos_str = ";".join(",".join(f"{v:.3f}" for v in p) for p in pos)
+        # location for each microphone (for rir.json)
+        self._rpos_cfg = [tuple(round(float(v), 3) for v in p) for p in pos]
 
     def set_spk(self, pos):
         """
@@ -83,28 +142,31 @@ class Room(object):
         """
         Return configure of room (exclude sound sources)
         """
-        Rf = lambda f: round(f, 3)
+        Rf = lambda f: round(float(f), 3)
         return {
             "beta": [Rf(f) for f in self.beta]
             if isinstance(self.beta, list) else Rf(self.beta),
-            "receiver_location": [tuple(Rf(n) for n in p) for p in self.rpos],
+            "receiver_location": self._rpos_cfg,
             "room_size": [Rf(n) for n in self.size],
             "receiver_geometric":
                 self.topo
         }
 
-    def plot(self, scfg, dest, room_id):
+    def plot(self, scfg, dest, room_id, backend="mpl"):
         """
         Visualize microphone array and speakers in current room
         """
-        fig, ax = plt.subplots()
+        if backend == "pil":
+            return self._plot_pil(scfg, dest, room_id)
+        fig, ax = get_canvas()
+        ax.clear()
         ax.set_aspect("equal", "box")
         # constraint length and width
         l, w, _ = self.size
         ax.set_xlim((0, l))
         ax.set_ylim((0, w))
         # draw microphone array
-        ax.plot([p[0] for p in self.rpos], [p[1] for p in self.rpos], "k.")
+        ax.plot(self.rpos[:, 0], self.rpos[:, 1], "k.")
         ax.plot([self.rcen[0]], [self.rcen[1]], "r+")
         # draw each speaker
         spkx = [cfg["pos"][0] for cfg in scfg]
@@ -116,12 +178,85 @@ class Room(object):
         ax.set_yticks([round(y, 1) for y in np.linspace(0, w, 5)])
         ax.set_title(f"{room_id} ({self.memo})")
         fig.savefig(dest, dpi=default_dpi, format=default_fmt)
-        plt.close(fig)
 
-    def rir(self, fname, sr=16000, rir_nsamps=4096, v=340, gpu=False):
+    def _plot_pil(self, scfg, dest, room_id, size=400, margin=40):
+        """
+        Visualize current room using PIL, much faster than matplotlib
+        """
+        l, w, _ = self.size
+        scale = (size - 2 * margin) / max(l, w)
+        W, H = round(l * scale) + 2 * margin, round(w * scale) + 2 * margin
+        image = Image.new("RGB", (W, H), "white")
+        draw = ImageDraw.Draw(image)
+        # room coordinate => pixel (y axis upwards)
+        to_pixel = lambda x, y: (margin + x * scale, H - margin - y * scale)
+
+        def cross(x, y, color, r=4):
+            px, py = to_pixel(x, y)
+            draw.line([(px - r, py), (px + r, py)], fill=color)
+            draw.line([(px, py - r), (px, py + r)], fill=color)
+
+        draw.rectangle([to_pixel(0, w), to_pixel(l, 0)], outline="black")
+        # draw ticks
+        for x in np.linspace(0, l, 5):
+            px, py = to_pixel(x, 0)
+            draw.line([(px, py), (px, py + 4)], fill="black")
+            draw.text((px - 8, py + 6), f"{x:.1f}", fill="black")
+        for y in np.linspace(0, w, 5):
+            px, py = to_pixel(0, y)
+            draw.line([(px - 4, py), (px, py)], fill="black")
+            draw.text((px - 28, py - 5), f"{y:.1f}", fill="black")
+        # draw microphone array
+        for x, y in self.rpos[:, :2]:
+            px, py = to_pixel(x, y)
+            draw.ellipse([px - 1, py - 1, px + 1, py + 1], fill="black")
+        cross(*self.rcen, "red")
+        # draw each speaker
+        for cfg in scfg:
+            cross(*cfg["pos"][:2], "black")
+        draw.text((margin, H - margin + 20),
+                  f"Length ({l:.2f}m), Width ({w:.2f}m)",
+                  fill="black")
+        draw.text((margin, margin // 2),
+                  f"{room_id} ({self.memo})",
+                  fill="black")
+        image.save(dest)
+
+    def rir(self,
+            fname,
+            sr=16000,
+            rir_nsamps=4096,
+            v=340,
+            gpu=False,
+            numba=False,
+            wav_dtype="float32",
+            writer=None):
         """
         Generate rir for current settings
+        fname: prefix of the wave files if self.spos is a list of the
+               speakers, i.e., gpu=True or numba=True
+        writer: executor to write wave files of the speakers asynchronously,
+                return list of the futures in that case
         """
+        # int16: peak normalized, float32: keep original scale
+        dump_int16 = wav_dtype == "int16"
+
+        def dump_batch(rirs):
+            # rirs: S x R x T
+            if dump_int16:
+                # normalize each source
+                rirs = quantize_rir(rirs, axis=(1, 2))
+            dump = lambda s: write_wav(f"{fname}-{s + 1}.wav",
+                                       rirs[s],
+                                       sr=sr,
+                                       normalize=not dump_int16)
+            S = rirs.shape[0]
+            if writer is None:
+                for s in range(S):
+                    dump(s)
+                return []
+            return [writer.submit(dump, s) for s in range(S)]
+
         if gpu:
             # self.beta: rt60
             # beta: reflection coefficients
@@ -134,40 +269,44 @@ class Room(object):
             rirs = pygpurir.simulateRIR(self.size,
                                         beta,
                                         np.array(self.spos),
-                                        np.array(self.rpos),
+                                        self.rpos,
                                         nb_img,
                                         tmax,
                                         sr,
                                         mic_pattern="omni")
-            S, _, _ = rirs.shape
-            for s in range(S):
-                write_wav(f"{fname}-{s + 1}.wav", rirs[s], sr=sr)
+            return dump_batch(rirs)
+        elif numba:
+            # all the speakers at once, S x R x T
+            rirs = ism_batch(self.size,
+                             self.beta,
+                             self.spos,
+                             self.rpos,
+                             sr=sr,
+                             nsamps=rir_nsamps,
+                             v=v)
+            return dump_batch(rirs)
         elif cpp_rir_available:
-            # format float
-            ffloat = lambda f: "{:.3f}".format(f)
-            # location for each microphone
-            loc_for_each_channel = [
-                ",".join(map(ffloat, p)) for p in self.rpos
+            # run without shell
+            argv = [
+                "rir-simulate", f"--sound-velocity={v}",
+                f"--samp-frequency={sr}", "--hp-filter=true",
+                f"--number-samples={rir_nsamps}", f"--beta={self._beta_str}",
+                f"--room-topo={self._size_str}",
+                f"--receiver-location={self._rpos_str}",
+                "--source-location=" + ",".join(f"{v:.3f}" for v in self.spos),
+                fname
             ]
-            beta = ",".join(map(ffloat, self.beta)) if isinstance(
-                self.beta, list) else round(self.beta, 3)
-            run_command(
-                "rir-simulate --sound-velocity={v} --samp-frequency={sample_rate} "
-                "--hp-filter=true --number-samples={rir_samples} --beta={beta} "
-                "--room-topo={room_size} --receiver-location=\"{receiver_location}\" "
-                "--source-location={source_location} {dump_dest}".format(
-                    v=v,
-                    sample_rate=sr,
-                    rir_samples=rir_nsamps,
-                    room_size=",".join(map(ffloat, self.size)),
-                    beta=beta,
-                    receiver_location=";".join(loc_for_each_channel),
-                    source_location=",".join(map(ffloat, self.spos)),
-                    dump_dest=fname))
+            p = subprocess.run(argv,
+                               stdout=subprocess.DEVNULL,
+                               stderr=subprocess.PIPE)
+            if p.returncode != 0:
+                raise RuntimeError("There was an error while running the "
+                                   f"command \"{' '.join(argv)}\":\n" +
+                                   bytes.decode(p.stderr))
         elif pyrirgen_available:
             rir = pyrirgen.generateRir(self.size,
                                        self.spos,
-                                       self.rpos,
+                                       self.rpos.tolist(),
                                        soundVelocity=v,
                                        fs=sr,
                                        nDim=3,
@@ -178,22 +317,86 @@ class Room(object):
                                        isHighPassFilter=True)
             if isinstance(rir, list):
                 rir = np.stack(rir)
-            write_wav(fname, rir, sr=sr)
+            if dump_int16:
+                rir = quantize_rir(rir)
+            write_wav(fname, rir, sr=sr, normalize=not dump_int16)
         else:
             raise RuntimeError("Both rir-simulate and pyrirgen unavailable")
 
 
+def simulate_rir(room, spos, fname, rir_kwargs):
+    """
+    Generate rir of one speaker on CPU (could run in worker processes)
+    """
+    room.set_spk(spos)
+    room.rir(fname, **rir_kwargs)
+
+
+def max_src_dist(rpos_2d, room_size_2d):
+    """
+    Max distance between array center and corners of the room
+    """
+    mx, my = rpos_2d
+    rx, ry = room_size_2d
+    # farthest corner is the opposite one in each axis
+    return math.hypot(max(mx, rx - mx), max(my, ry - my))
+
+
+def sample_speakers(center,
+                    room_size,
+                    spk_height,
+                    src_dist,
+                    num_spks,
+                    retry=5,
+                    rng=np.random):
+    """
+    Sample speaker locations around the microphone array
+    Arguments:
+        center: (x, y) of the array center
+        room_size: (l, w, h) of the room
+        spk_height/src_dist: range of speaker's height/distance
+        rng: random state to sample from
+    Return:
+        spk: K x 5 array of (sx, sy, sz, doa, dst), K <= num_spks
+        ntry: number of candidates consumed
+    """
+    mx, my = center
+    rx, ry, rz = room_size
+    max_retry = retry * num_spks
+    min_dst, max_dst = src_dist
+    max_dst = min(max_dst, max_src_dist((mx, my), (rx, ry)))
+    # draw all candidates at once and keep the valid ones
+    sz = rng.uniform(*spk_height, max_retry)
+    # speaker distance
+    dst = rng.uniform(min_dst, max_dst, max_retry)
+    # sample from 0-360
+    doa = rng.uniform(0, np.pi * 2, max_retry)
+
+    sx = mx + np.cos(doa) * dst
+    sy = my + np.sin(doa) * dst
+
+    # check speaker location
+    inside = (sz < rz) & (sx > 0) & (sx < rx) & (sy > 0) & (sy < ry)
+    index = np.flatnonzero(inside)[:num_spks]
+    # NOTE: index is empty if num_spks == 0
+    ntry = index[-1] + 1 if 0 < index.size == num_spks else max_retry
+    spk = np.stack([sx, sy, sz, doa, dst], -1)[index]
+    return spk, ntry
+
+
 class RoomGenerator(object):
     """
     Room generator
     """
 
-    def __init__(self, rt60_opt, absc_opt, room_dim):
+    def __init__(self, rt60_opt, absc_opt, room_dim, rng=np.random):
         """
         rt60_opt: "" or "a,b", higher priority than absc_opt
         absc_opt: tuple like (a,b)
         room_dim: str like "a,b;c,d;e,d"
+        rng: random state to sample from
         """
+        self.rng = rng
         self.rt60_opt = rt60_opt
         if not rt60_opt:
             self.absc = UniformSampler(absc_opt)
@@ -205,26 +408,41 @@ class RoomGenerator(object):
             raise RuntimeError(f"Wrong format with --room-dim={room_dim}")
         self.dim_sampler = [UniformSampler(c) for c in dim_range]
 
+    def generate_batch(self, n, v=340):
+        """
+        Sample n rooms at once, return list of the valid ones
+        """
+        # n x 3: (l, w, h)
+        dims = np.stack(
+            [self.rng.uniform(s.min, s.max, n) for s in self.dim_sampler],
+            -1)
+        if not self.rt60_opt:
+            absc = self.rng.uniform(self.absc.min, self.absc.max, n)
+            refl = np.sqrt(1 - absc)
+            return [
+                Room(*d, refl=r) for d, r in zip(dims.tolist(), refl.tolist())
+            ]
+        # no reflection is ok
+        if self.rt60.max == 0:
+            return [Room(*d, rt60=0) for d in dims.tolist()]
+        # check rt60 here
+        l, w, h = dims.T
+        S, V = l * w * h, (l * w + l * h + w * h) * 2
+        # sabine formula
+        rt60_min = 24 * V * np.log(10) / (v * S)
+        valid = rt60_min < self.rt60.max
+        rt60 = self.rng.uniform(rt60_min[valid], self.rt60.max)
+        return [
+            Room(*d, rt60=r)
+            for d, r in zip(dims[valid].tolist(), rt60.tolist())
+        ]
+
     def generate(self, v=340):
-        # (l, w, h)
-        (l, w, h) = (s.sample() for s in self.dim_sampler)
-        if self.rt60_opt:
-            # no reflection is ok
-            if self.rt60.max == 0:
-                return Room(l, w, h, rt60=0)
-            else:
-                # check rt60 here
-                S, V = l * w * h, (l * w + l * h + w * h) * 2
-                # sabine formula
-                rt60_min = 24 * V * np.log(10) / (v * S)
-                if rt60_min >= self.rt60.max:
-                    return None
-                else:
-                    rt60 = random.uniform(rt60_min, self.rt60.max)
-                    return Room(l, w, h, rt60=rt60)
-        else:
-            absc = self.absc.sample()
-            return Room(l, w, h, refl=np.sqrt(1 - absc))
+        """
+        Sample one room, return None if failed
+        """
+        rooms = self.generate_batch(1, v=v)
+        return rooms[0] if rooms else None
 
 
 class RirSimulator(object):
@@ -235,128 +453,212 @@ class RirSimulator(object):
     def __init__(self, args):
         if args.gpu and not gpu_rir_available:
             raise RuntimeError("Please install gpuRIR first if --gpu=True")
+        if args.gpu:
+            pygpurir.activateMixedPrecision(args.gpu_mixed_precision)
+            pygpurir.activateLUT(True)
+        if args.plot_backend == "pil" and not pil_available:
+            raise RuntimeError(
+                "Please install Pillow first if --plot-backend=pil")
+        if args.numba and not numba_available:
+            raise RuntimeError("Please install numba first if --numba=True")
+        if args.gpu:
+            backend = "gpuRIR"
+        elif args.numba:
+            backend = "numba"
+        elif cpp_rir_available:
+            backend = "rir-simulate"
+        elif pyrirgen_available:
+            backend = "pyrirgen"
+        else:
+            raise RuntimeError("Both rir-simulate and pyrirgen unavailable, "
+                               "try --numba=True or --gpu=True")
+        logger.info(f"Generate rirs using {backend}")
+        # generate rirs of all speakers in one call (gpuRIR & numba)
+        self.batch_rir = args.gpu or args.numba
         # make dump dir
         Path(args.dump_dir).mkdir(exist_ok=True, parents=True)
-        self.rirs_cfg = []
-        self.room_generator = RoomGenerator(args.rt60, args.abs_range,
-                                            args.room_dim)
+        # CPU rir generation of the rooms in flight (if --nj > 1)
+        self.rirs_job = deque()
+        # futures of the wave files (previous room) written in background
+        self.write_jobs = []
+        # all the samplings share one random state (seeded by --seed)
+        self.rng = np.random.RandomState(args.seed)
+        self.room_generator = RoomGenerator(args.rt60,
+                                            args.abs_range,
+                                            args.room_dim,
+                                            rng=self.rng)
+        # pre-sampled rooms, refilled when used up
+        self.room_bank = []
         self.mx, self.my = args.array_relx, args.array_rely
         self.array_topo = [str2tuple(t) for t in args.array_topo.split(";")]
         self.sr = args.sr
         self.args = args
 
+    def _next_room(self):
+        """
+        Pop one room from the bank (sample a batch of rooms if empty)
+        """
+        while not self.room_bank:
+            self.room_bank = self.room_generator.generate_batch(
+                min(self.args.num_rooms, 256), v=self.args.speed)
+            # consume in the order of sampling
+            self.room_bank.reverse()
+        return self.room_bank.pop()
+
     def _place_mic(self, room):
         x, y, _ = room.size
         # sample array location
         # (mx, my) center postion of array
-        mx = random.uniform(*(x * v for v in self.mx))
-        my = random.uniform(*(y * v for v in self.my))
-        mz = random.uniform(*self.args.array_height)
+        mx = self.rng.uniform(*(x * v for v in self.mx))
+        my = self.rng.uniform(*(y * v for v in self.my))
+        mz = self.rng.uniform(*self.args.array_height)
         # place array
         room.set_mic(self.array_topo, (mx, my, mz))
         return (mx, my), room
 
-    def _max_src_dist(self, rpos_2d, room_size_2d):
-        mx, my = rpos_2d
-        rx, ry = room_size_2d
-        bound = [(0, 0), (0, ry), (rx, 0), (rx, ry)]
-        dist = [((mx - x) ** 2 + (my - y) ** 2) ** 0.5 for (x, y) in bound]
-        return max(dist)
-
     def _place_spk(self, center, room):
         num_rirs = self.args.num_rirs
-        done, ntry = 0, 0
-        mx, my = center
-        rx, ry, rz = room.size
-        max_retry = self.args.retry * num_rirs
-        stats = []
-
-        min_src_dist, max_src_dist = args.src_dist
-        max_src_dist = min(max_src_dist, self._max_src_dist((mx, my),
-                                                            (rx, ry)))
-
-        Rf = lambda f: round(f, 3)
-        while True:
-            ntry += 1
-            if ntry > max_retry:
-                break
-            sz = random.uniform(*args.speaker_height)
-            if sz >= rz:
-                continue
-
-            # speaker distance
-            dst = random.uniform(min_src_dist, max_src_dist)
-            # sample from 0-360
-            doa = random.uniform(0, np.pi * 2)
-
-            sx = mx + np.cos(doa) * dst
-            sy = my + np.sin(doa) * dst
-
-            # check speaker location
-            if 0 >= sx or sx >= rx or 0 >= sy or sy >= ry:
-                continue
-            done += 1
-            stat = {
-                "pos": (Rf(sx), Rf(sy), Rf(sz)),
-                "doa": Rf(doa * 180 / np.pi),
-                "dst": Rf(dst)
-            }
-            stats.append(stat)
-            if done == num_rirs:
-                break
+        spk, ntry = sample_speakers(center,
+                                    room.size,
+                                    self.args.speaker_height,
+                                    self.args.src_dist,
+                                    num_rirs,
+                                    retry=self.args.retry,
+                                    rng=self.rng)
+        done = spk.shape[0]
+        Rf = lambda f: round(float(f), 3)
+        stats = [{
+            "pos": (Rf(sx), Rf(sy), Rf(sz)),
+            "doa": Rf(math.degrees(doa)),
+            "dst": Rf(dst)
+        } for (sx, sy, sz, doa, dst) in spk]
         logger.info(f"Put speaker point: try/done = {ntry}/{done}")
         return done == num_rirs, stats
 
-    def run_for_instance(self, room_id):
-        room = None
-        while not room:
-            room = self.room_generator.generate(v=self.args.speed)
+    def sample_instance(self):
+        """
+        Sample one room with array & speakers, return (room, scfg) or None
+        if failed to place the speakers
+        """
+        room = self._next_room()
         rpos, room = self._place_mic(room)
         succ, scfg = self._place_spk(rpos, room)
-        if succ:
-            rcfg = room.conf()
-            for idx, cfg in enumerate(scfg):
-                cfg["loc"] = f"{self.args.dump_dir}/Room{room_id}-{idx + 1}.wav"
-            if gpu_rir_available and self.args.gpu:
-                # place all spakers and generate at once
-                room.set_spk([cfg["pos"] for cfg in scfg])
-                room.rir(f"{self.args.dump_dir}/Room{room_id}",
-                         sr=self.sr,
-                         rir_nsamps=int(self.sr * self.args.rir_dur),
-                         v=self.args.speed,
-                         gpu=True)
-            else:
-                for cfg in scfg:
-                    # place one spk and generate rir one by one
-                    room.set_spk(cfg["pos"])
-                    room.rir(cfg["loc"],
-                             sr=self.sr,
-                             rir_nsamps=int(self.sr * self.args.rir_dur),
-                             v=self.args.speed)
-            # plot room
-            room.plot(scfg,
-                      f"{self.args.dump_dir}/Room{room_id}.{default_fmt}",
-                      f"Room{room_id}")
-            rcfg["spk"] = scfg
-            self.rirs_cfg.append(rcfg)
-        return succ
+        return (room, scfg) if succ else None
+
+    def sample_instances(self):
+        """
+        Sample rooms until num_rooms of them succeed (or out of retries)
+        """
+        num_rooms = self.args.num_rooms
+        done = 0
+        for _ in range(self.args.retry * num_rooms):
+            if done == num_rooms:
+                break
+            instance = self.sample_instance()
+            done += instance is not None
+            yield instance
+
+    def _simulate_cpu(self, jobs, pool=None):
+        """
+        Generate rirs of one room on CPU, using worker processes if pool
+        is given (at most --nj rooms in flight)
+        """
+        if pool is None:
+            for job in jobs:
+                simulate_rir(*job)
+        else:
+            if len(self.rirs_job) >= self.args.nj:
+                # get(): raise exceptions in the worker processes
+                self.rirs_job.popleft().get()
+            self.rirs_job.append(pool.starmap_async(simulate_rir, jobs))
+
+    def run_for_instance(self, room_id, room, scfg, writer=None, pool=None):
+        """
+        Simulate one sampled room, return configuration of the room
+        """
+        rcfg = room.conf()
+        for idx, cfg in enumerate(scfg):
+            cfg["loc"] = f"{self.args.dump_dir}/Room{room_id}-{idx + 1}.wav"
+        if self.batch_rir:
+            # place all spakers and generate at once
+            room.set_spk([cfg["pos"] for cfg in scfg])
+            write_jobs = room.rir(
+                f"{self.args.dump_dir}/Room{room_id}",
+                sr=self.sr,
+                rir_nsamps=int(self.sr * self.args.rir_dur),
+                v=self.args.speed,
+                gpu=self.args.gpu,
+                numba=self.args.numba,
+                wav_dtype=self.args.wav_dtype,
+                writer=writer)
+            # wait for the previous room, so at most 2 rooms are pending
+            # result(): raise exceptions in the writer threads
+            for job in self.write_jobs:
+                job.result()
+            self.write_jobs = write_jobs
+        else:
+            rir_kwargs = {
+                "sr": self.sr,
+                "rir_nsamps": int(self.sr * self.args.rir_dur),
+                "v": self.args.speed,
+                "wav_dtype": self.args.wav_dtype
+            }
+            # place one spk and generate rir one by one
+            self._simulate_cpu(
+                [(room, cfg["pos"], cfg["loc"], rir_kwargs) for cfg in scfg],
+                pool=pool)
+        # plot room
+        room.plot(scfg,
+                  f"{self.args.dump_dir}/Room{room_id}.{default_fmt}",
+                  f"Room{room_id}",
+                  backend=self.args.plot_backend)
+        rcfg["spk"] = scfg
+        return rcfg
 
     def run(self):
         num_rooms = self.args.num_rooms
-        max_retry = self.args.retry * num_rooms
         done, ntry = 0, 0
-        while True:
-            ntry += 1
-            if ntry > max_retry:
-                break
-            succ = self.run_for_instance(done + 1)
-            if succ:
+        # sample rooms in a background thread while simulating (GPU),
+        # plotting & dumping the previous ones in the main thread
+        instances = prefetch(self.sample_instances(), size=4)
+        # dump rir configurations incrementally (in json list)
+        cfg_path = Path(self.args.dump_dir) / "rir.json"
+        tmp_path = cfg_path.with_suffix(".json.tmp")
+        with ExitStack() as stack:
+            # write rirs in background threads (gpuRIR & numba),
+            # overlapped with the next room
+            writer = None
+            if self.batch_rir:
+                writer = stack.enter_context(ThreadPoolExecutor(max_workers=8))
+            # generate rirs on CPU in worker processes (each speaker is
+            # independent), created before the sampling thread starts
+            pool = None
+            if self.args.nj > 1 and not self.batch_rir:
+                pool = stack.enter_context(Pool(self.args.nj))
+            f = stack.enter_context(open(tmp_path, "w"))
+            # stop the sampling thread if the loop exits on errors
+            stack.enter_context(closing(instances))
+            f.write("[")
+            for instance in instances:
+                ntry += 1
+                if not instance:
+                    continue
+                rcfg = self.run_for_instance(done + 1,
+                                             *instance,
+                                             writer=writer,
+                                             pool=pool)
+                f.write(",\n" if done else "\n")
+                f.write(textwrap.indent(json.dumps(rcfg, indent=2), "  "))
                 done += 1
-            if done == num_rooms:
-                break
-        # dump rir configurations
-        with open(Path(args.dump_dir) / "rir.json", "w") as f:
-            json.dump(self.rirs_cfg, f, indent=2)
+            f.write("\n]" if done else "]")
+            # wait for the rooms in flight
+            while self.rirs_job:
+                self.rirs_job.popleft().get()
+            for job in self.write_jobs:
+                job.result()
+        # all the rirs are generated, expose rir.json
+        tmp_path.replace(cfg_path)
+        close_canvas()
         logger.info(f"Generate {self.args.num_rirs * num_rooms:d} rirs, " +
                     f"{done:d} rooms done, try = {ntry}")
 
@@ -409,6 +711,14 @@ if __name__ == "__main__":
                         type=int,
                         default=16000,
                         help="Sample rate of simulated signal")
+    parser.add_argument("--wav-dtype",
+                        type=str,
+                        default="float32",
+                        choices=["float32", "int16"],
+                        help="Sample type of the rirs passed to write_wav, "
+                             "int16 means peak normalized samples (out of "
+                             "gpuRIR, numba or pyrirgen, rir-simulate "
+                             "writes wave files itself)")
     parser.add_argument("--dump-dir",
                         type=str,
                         default="rir",
@@ -471,10 +781,38 @@ if __name__ == "__main__":
                         default=(1, 3),
                         help="Range of distance between "
                              "microphone arrays and speakers")
+    parser.add_argument("--nj",
+                        type=int,
+                        default=1,
+                        help="Number of processes to generate rirs "
+                             "in parallel (not used when --gpu=True or "
+                             "--numba=True, which is multi-threaded)")
     parser.add_argument("--gpu",
                         type=strtobool,
                         default=False,
                         help="Use gpuRIR from "
                              "https://github.com/DavidDiazGuerra/gpuRIR.git")
+    parser.add_argument("--numba",
+                        type=strtobool,
+                        default=False,
+                        help="Use the multi-threaded image source method "
+                             "implemented with numba (libs/ism_numba.py) "
+                             "instead of rir-simulate or pyrirgen")
+    parser.add_argument("--gpu-mixed-precision",
+                        type=strtobool,
+                        default=True,
+                        help="Use mixed precision (FP16) in gpuRIR, "
+                             "which requires Pascal or newer GPUs")
+    parser.add_argument("--seed",
+                        type=int,
+                        default=None,
+                        help="Random seed for room & array & "
+                             "speaker sampling")
+    parser.add_argument("--plot-backend",
+                        type=str,
+                        default="mpl",
+                        choices=["mpl", "pil"],
+                        help="Backend used to plot the rooms, "
+                             "PIL (Pillow) is much faster than matplotlib")
     args = parser.parse_args()
     run(args)